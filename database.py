@@ -0,0 +1,241 @@
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import asyncpg
+import orjson
+from pgvector.asyncpg import register_vector
+
+from config import settings
+
+# Global asyncpg pool, created on startup. Prisma is kept for schema
+# migrations only; runtime queries go through this pool so parameters and
+# rows travel in Postgres binary format instead of being JSON-serialized
+# through the Prisma engine.
+_pool: Optional[asyncpg.Pool] = None
+
+
+def _connect_args() -> Tuple[str, Optional[Dict[str, str]]]:
+    """
+    Split the configured URL into an asyncpg DSN and server settings.
+
+    Prisma URLs carry a ?schema=... argument that asyncpg does not
+    understand; it maps to the session search_path so runtime queries hit
+    the same schema Prisma migrates. Every other query parameter (sslmode
+    and friends) stays on the DSN.
+    """
+    parts = urlsplit(settings.database_url)
+    params = dict(parse_qsl(parts.query))
+    schema = params.pop("schema", None)
+    dsn = urlunsplit(parts._replace(query=urlencode(params)))
+    server_settings = {"search_path": schema} if schema else None
+    return dsn, server_settings
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """
+    Register per-connection codecs: pgvector binary + orjson for json/jsonb.
+
+    The json codecs are registered in binary format: binary COPY refuses
+    text-format codecs, so text registration would break the batch insert
+    path. On the wire, binary json is the plain UTF-8 text and binary jsonb
+    prefixes it with a version byte.
+    """
+    await register_vector(conn)
+    await conn.set_type_codec(
+        "json",
+        encoder=orjson.dumps,
+        decoder=orjson.loads,
+        schema="pg_catalog",
+        format="binary"
+    )
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=lambda v: b"\x01" + orjson.dumps(v),
+        decoder=lambda b: orjson.loads(b[1:]),
+        schema="pg_catalog",
+        format="binary"
+    )
+
+
+async def connect():
+    """Create the connection pool"""
+    global _pool
+    if _pool is None:
+        dsn, server_settings = _connect_args()
+        _pool = await asyncpg.create_pool(
+            dsn=dsn,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            init=_init_connection,
+            server_settings=server_settings
+        )
+
+
+async def disconnect():
+    """Close the connection pool"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> asyncpg.Pool:
+    """Return the active pool (connect() must have run)"""
+    if _pool is None:
+        raise RuntimeError("Database pool is not initialized")
+    return _pool
+
+
+async def fetch(query: str, *args: Any) -> List[asyncpg.Record]:
+    """Run a query on a pooled connection and return all rows"""
+    async with get_pool().acquire() as conn:
+        return await conn.fetch(query, *args)
+
+
+async def copy_records(table: str, records: List[tuple], columns: List[str]):
+    """
+    Stream rows into a table with binary COPY.
+
+    Uses the connection codecs (pgvector, orjson jsonb), has no parameter
+    -count ceiling, and costs one round-trip regardless of row count.
+    """
+    async with get_pool().acquire() as conn:
+        await conn.copy_records_to_table(table, records=records, columns=columns)
+
+
+async def copy_and_execute(
+    table: str, records: List[tuple], columns: List[str], followup_sql: str, *args: Any
+):
+    """
+    COPY rows and run a follow-up statement atomically in one transaction.
+
+    A connection runs one statement at a time, so the pair is pipelined on
+    the same connection rather than issued as two pool round-trips; the
+    transaction also keeps the follow-up (e.g. stats) consistent with the
+    inserted rows.
+    """
+    async with get_pool().acquire() as conn:
+        async with conn.transaction():
+            await conn.copy_records_to_table(table, records=records, columns=columns)
+            await conn.execute(followup_sql, *args)
+
+
+async def fetch_with_setup(setup_sql: str, query: str, *args: Any) -> List[asyncpg.Record]:
+    """
+    Run a setup statement and a query inside one transaction.
+
+    Used for SET LOCAL session tuning (e.g. hnsw.ef_search), which only
+    takes effect within the transaction that issues it.
+    """
+    async with get_pool().acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(setup_sql)
+            return await conn.fetch(query, *args)
+
+
+_FILE_COUNTS_DEFAULT = (
+    '{"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0}'
+)
+
+# Arbitrary application-wide advisory lock key for the startup DDL
+_STARTUP_DDL_LOCK = 0x70677665  # "pgve"
+
+
+async def ensure_schema():
+    """
+    Run the startup DDL (indexes, defaults, migrations) under an advisory
+    lock.
+
+    Every uvicorn worker executes the lifespan, so without serialization N
+    workers race the same CREATE INDEX / DROP INDEX / backfill statements -
+    concurrent CREATE INDEX IF NOT EXISTS can still collide on the catalog,
+    and the normalization backfill would run once per worker. The lock
+    makes one worker do the work while the rest wait, then pass through the
+    now-idempotent statements.
+    """
+    async with get_pool().acquire() as conn:
+        await conn.execute("SELECT pg_advisory_lock($1)", _STARTUP_DDL_LOCK)
+        try:
+            await ensure_indexes()
+            await ensure_defaults()
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", _STARTUP_DDL_LOCK)
+
+
+async def ensure_defaults():
+    """
+    Backfill and enforce NOT NULL defaults on the store stats columns.
+
+    With usage_bytes and file_counts guaranteed non-null, the per-insert
+    stats updates can drop their COALESCE wrappers - one less expression
+    per row, and the planner can inline the plain arithmetic. Idempotent,
+    so safe to run on every startup.
+    """
+    table = settings.table_names["vector_stores"]
+    await fetch(f"UPDATE {table} SET usage_bytes = 0 WHERE usage_bytes IS NULL")
+    await fetch(
+        f"UPDATE {table} SET file_counts = '{_FILE_COUNTS_DEFAULT}'::jsonb"
+        f" WHERE file_counts IS NULL"
+    )
+    await fetch(
+        f"""
+        ALTER TABLE {table}
+            ALTER COLUMN usage_bytes SET DEFAULT 0,
+            ALTER COLUMN usage_bytes SET NOT NULL,
+            ALTER COLUMN file_counts SET DEFAULT '{_FILE_COUNTS_DEFAULT}'::jsonb,
+            ALTER COLUMN file_counts SET NOT NULL
+        """
+    )
+
+
+async def ensure_indexes():
+    """
+    Create the hot-path indexes if they are missing.
+
+    The HNSW index turns ORDER BY embedding <=> $1 from an O(rows)
+    sequential scan into a sublinear graph walk; the composite
+    (created_at, id) index backs keyset pagination in the store listing.
+    Idempotent, so safe to run on every startup.
+    """
+    fields = settings.db_fields
+    table = settings.table_names["embeddings"]
+    stores = settings.table_names["vector_stores"]
+    ops = (
+        "halfvec_ip_ops"
+        if settings.embedding.vector_type == "halfvec"
+        else "vector_ip_ops"
+    )
+    # One-time migration to inner-product search, keyed on the ip index
+    # not existing yet: any database without it may hold rows written
+    # before the switch, which are not unit vectors and would rank wrongly
+    # under <#>, so they are normalized in place first. A leftover
+    # cosine-ops index from before the switch is dropped. On a fresh
+    # database the backfill scans an empty table and is free.
+    ip_index = f"{table}_{fields.embedding_field}_hnsw_ip"
+    if not await fetch("SELECT 1 FROM pg_indexes WHERE indexname = $1", ip_index):
+        await fetch(
+            f"UPDATE {table} SET {fields.embedding_field} ="
+            f" l2_normalize({fields.embedding_field})"
+        )
+        await fetch(f"DROP INDEX IF EXISTS {table}_{fields.embedding_field}_hnsw")
+    await fetch(
+        f"""
+        CREATE INDEX IF NOT EXISTS {ip_index}
+        ON {table} USING hnsw ({fields.embedding_field} {ops})
+        WITH (m = 16, ef_construction = 64)
+        """
+    )
+    await fetch(
+        f"""
+        CREATE INDEX IF NOT EXISTS {stores}_created_at_id
+        ON {stores} (created_at DESC, id DESC)
+        """
+    )
+    # Serves the metadata @> containment filter on search; jsonb_path_ops
+    # indexes only containment, which keeps it smaller than the default ops
+    await fetch(
+        f"""
+        CREATE INDEX IF NOT EXISTS {table}_{fields.metadata_field}_gin
+        ON {table} USING gin ({fields.metadata_field} jsonb_path_ops)
+        """
+    )
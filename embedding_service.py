@@ -1,90 +1,312 @@
-from typing import List, Optional
+import asyncio
+import collections
+import hashlib
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
 from config import settings, EmbeddingConfig
 from litellm.types.utils import EmbeddingResponse
 import litellm
 import logging
 
+
+# Provider-side batch cap and bound on concurrently dispatched chunks for
+# multi-chunk embedding requests
+_MAX_BATCH = 96
+_CONCURRENCY = 8
+
+
+class EmbeddingBackend:
+    """Base interface for embedding backends"""
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a list of texts"""
+        raise NotImplementedError
+
+
+class LiteLLMBackend(EmbeddingBackend):
+    """Backend that calls the LiteLLM proxy over HTTP"""
+
+    def __init__(self, config: EmbeddingConfig):
+        self.config = config
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response: EmbeddingResponse = await litellm.aembedding(
+            model=self.config.model,
+            input=texts,
+            api_base=self.config.base_url,
+            api_key=self.config.api_key
+        )
+        logging.debug(f"Embedding response: {response}")
+        return [
+            item["embedding"] if isinstance(item, dict) else item.embedding
+            for item in response.data
+        ]
+
+
+class LocalStaticEmbedder(EmbeddingBackend):
+    """
+    Backend that runs a static embedding model (model2vec) in-process.
+
+    Avoids the network round-trip to the LiteLLM proxy on the query path:
+    static models embed in microseconds on CPU, so the embedding call stops
+    dominating search latency. The model is loaded once and reused.
+    """
+
+    def __init__(self, config: EmbeddingConfig):
+        # Imported lazily so the default LiteLLM backend works without model2vec
+        from model2vec import StaticModel
+        self.config = config
+        self._model = StaticModel.from_pretrained(config.local_model)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts to a normalized float32 matrix (blocking)"""
+        vectors = np.asarray(self._model.encode(texts), dtype=np.float32)
+        # Pre-normalize so cosine distance downstream stays valid
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        # Run the CPU-bound encode off the event loop; the float32 matrix is
+        # passed through as-is so callers keep a contiguous buffer
+        return await asyncio.to_thread(self.encode, texts)
+
+
+class EmbeddingCache:
+    """
+    Async-safe LRU + TTL cache for query embeddings.
+
+    Keys are blake2b digests of (model, text), values are float32 numpy
+    arrays so hits can be reused zero-copy by the binary serializer.
+    Entries expire after the configured TTL so a remapped upstream model
+    cannot serve stale vectors indefinitely. functools.lru_cache cannot
+    wrap coroutines, hence the explicit OrderedDict guarded by an
+    asyncio.Lock.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "collections.OrderedDict[bytes, Tuple[np.ndarray, float]]" = collections.OrderedDict()
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{model}\x00{text}".encode(), digest_size=16).digest()
+
+    async def get(self, key: bytes) -> Optional[np.ndarray]:
+        async with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            embedding, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return embedding
+
+    async def put(self, key: bytes, embedding: np.ndarray):
+        async with self._lock:
+            self._entries[key] = (embedding, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class QueryEmbedBatcher:
+    """
+    Coalesces concurrent query embeddings into one backend call.
+
+    One batched call of N queries costs roughly the same as a single call
+    against a remote embedding API, so under concurrent load the per-query
+    overhead (HTTP round-trip, provider request accounting) is amortized
+    across the batch. The first query to arrive opens a short window; all
+    queries submitted before it closes - or before the batch cap is hit -
+    are dispatched together, and each submitter gets its row back through
+    its own Future.
+    """
+
+    def __init__(self, service: "EmbeddingService", window: float, max_batch: int):
+        self.service = service
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+
+    async def submit(self, text: str) -> np.ndarray:
+        """Join the current coalescing window and await this text's embedding"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        self._flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        timer, self._timer = self._timer, None
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        if pending:
+            asyncio.create_task(self._run_batch(pending))
+
+    async def _run_batch(self, pending: List[Tuple[str, asyncio.Future]]):
+        try:
+            embeddings = await self.service.generate_embeddings(
+                [text for text, _ in pending]
+            )
+        except Exception as exc:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), row in zip(pending, embeddings):
+            if not future.done():
+                future.set_result(row)
+
+
 class EmbeddingService:
-    """Service for generating embeddings using OpenAI SDK pointed at LiteLLM proxy"""
-    
+    """Service for generating embeddings via a configurable backend"""
+
     def __init__(self, config: Optional[EmbeddingConfig] = None):
         self.config = config or settings.embedding
+        self._backend: Optional[EmbeddingBackend] = None
+        self._cache = EmbeddingCache(
+            maxsize=self.config.cache_size, ttl=self.config.cache_ttl_seconds
+        )
+        self._batcher = QueryEmbedBatcher(
+            self,
+            window=self.config.batch_window_seconds,
+            max_batch=self.config.batch_max_queries
+        )
 
+    @property
+    def backend(self) -> EmbeddingBackend:
+        """Lazily construct the configured backend"""
+        if self._backend is None:
+            if self.config.backend == "local":
+                self._backend = LocalStaticEmbedder(self.config)
+            else:
+                self._backend = LiteLLMBackend(self.config)
+        return self._backend
 
-    
-    async def generate_embedding(self, text: str) -> List[float]:
+    async def generate_embedding(self, text: str) -> np.ndarray:
         """
-        Generate embedding for a single text using LiteLLM proxy
-        
+        Generate embedding for a single text
+
+        Repeat queries (pagination, retries, popular prompts) hit the
+        in-process LRU instead of paying a backend round-trip.
+
         Args:
             text: Text to embed
-            
+
         Returns:
-            List of floats representing the embedding vector
+            Float32 numpy array representing the embedding vector
         """
+        cache_key = EmbeddingCache.key(self.config.model, text)
+        cached = await self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
-            response: EmbeddingResponse = await litellm.aembedding(
-                model=self.config.model,
-                input=[text],
-                api_base=self.config.base_url,
-                api_key=self.config.api_key
-            )
-            logging.debug(f"Embedding response: {response}")
-            
-            # Extract embedding from response
-            embedding = response.data[0]["embedding"]
-            
+            embeddings = await self.backend.embed([text])
+            embedding = np.asarray(embeddings[0], dtype=np.float32)
+
             # Validate embedding dimensions
-            if len(embedding) != self.config.dimensions:
+            if embedding.shape != (self.config.dimensions,):
                 raise ValueError(
                     f"Expected embedding dimension {self.config.dimensions}, "
-                    f"got {len(embedding)}"
+                    f"got {embedding.shape[0]}"
                 )
-            
-            return embedding
-            
+
         except Exception as e:
             raise RuntimeError(f"Failed to generate embedding: {str(e)}")
-    
-    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+
+        await self._cache.put(cache_key, embedding)
+        return embedding
+
+    async def generate_query_embedding(self, text: str) -> np.ndarray:
+        """
+        Generate a query embedding, coalescing concurrent misses.
+
+        Cache hits return immediately; misses join the micro-batcher so
+        concurrent searches share one backend call. The local backend
+        embeds in microseconds, so for it the coalescing window would only
+        add latency - it goes straight through the single-text path.
+        """
+        if self.config.backend == "local":
+            return await self.generate_embedding(text)
+
+        cache_key = EmbeddingCache.key(self.config.model, text)
+        cached = await self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        embedding = await self._batcher.submit(text)
+        await self._cache.put(cache_key, embedding)
+        return embedding
+
+    async def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """
         Generate embeddings for multiple texts
-        
+
         Args:
             texts: List of texts to embed
-            
+
         Returns:
-            List of embedding vectors
+            Float32 matrix of shape (len(texts), dimensions)
         """
         try:
-            # Generate embeddings using LiteLLM
-            response = await litellm.aembedding(
-                model=self.config.model,
-                input=texts,
-                api_base=self.config.base_url,
-                api_key=self.config.api_key
-            )
-            
-            # Extract embeddings from response
-            embeddings = [item.embedding for item in response.data]
-            
-            # Validate embedding dimensions
-            for i, embedding in enumerate(embeddings):
-                if len(embedding) != self.config.dimensions:
-                    raise ValueError(
-                        f"Expected embedding dimension {self.config.dimensions} for text {i}, "
-                        f"got {len(embedding)}"
-                    )
-            
+            if len(texts) <= _MAX_BATCH:
+                embeddings = np.asarray(await self.backend.embed(texts), dtype=np.float32)
+            else:
+                # Dispatch provider-sized chunks with bounded concurrency so
+                # large requests neither exceed provider batch limits nor
+                # serialize one round-trip per chunk
+                semaphore = asyncio.Semaphore(_CONCURRENCY)
+
+                async def embed_chunk(chunk: List[str]) -> np.ndarray:
+                    async with semaphore:
+                        return np.asarray(await self.backend.embed(chunk), dtype=np.float32)
+
+                chunks = [texts[i:i + _MAX_BATCH] for i in range(0, len(texts), _MAX_BATCH)]
+                embeddings = np.vstack(await asyncio.gather(*(embed_chunk(c) for c in chunks)))
+
+            # A single O(1) shape check replaces the per-row len() loop, and
+            # the contiguous float32 buffer feeds binary insertion directly
+            if embeddings.shape != (len(texts), self.config.dimensions):
+                raise ValueError(
+                    f"Expected embeddings of shape ({len(texts)}, {self.config.dimensions}), "
+                    f"got {embeddings.shape}"
+                )
+
             return embeddings
-            
+
         except Exception as e:
             raise RuntimeError(f"Failed to generate embeddings: {str(e)}")
-    
+
     def update_config(self, new_config: EmbeddingConfig):
-        """Update the embedding configuration"""
+        """Update the embedding configuration and reset backend, cache and batcher"""
         self.config = new_config
+        self._backend = None
+        self._cache = EmbeddingCache(
+            maxsize=new_config.cache_size, ttl=new_config.cache_ttl_seconds
+        )
+        self._batcher = QueryEmbedBatcher(
+            self,
+            window=new_config.batch_window_seconds,
+            max_batch=new_config.batch_max_queries
+        )
 
 
 # Global embedding service instance
-embedding_service = EmbeddingService() 
\ No newline at end of file
+embedding_service = EmbeddingService()
@@ -0,0 +1,212 @@
+"""
+In-process similarity scoring for small vector stores.
+
+For stores whose embeddings fit comfortably in memory, the per-query cost is
+dominated by the DB round-trip rather than the distance math. This module
+caches a store's candidate rows as one contiguous float32 matrix (SoA layout)
+and scores queries against it with SIMD kernels (simsimd when installed,
+numpy otherwise), skipping the pgvector scan entirely while the cache is
+fresh. Stores larger than the configured row cap always fall back to SQL.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import simsimd
+except ImportError:  # pragma: no cover - optional SIMD acceleration
+    simsimd = None
+
+import database
+from config import settings, DB_FIELDS
+from pgvector.utils import HalfVector, Vector
+
+_VECTOR_STORES_TABLE = settings.table_names["vector_stores"]
+_EMBEDDINGS_TABLE = settings.table_names["embeddings"]
+
+
+def _as_float32(value: Any) -> np.ndarray:
+    """
+    Convert a decoded pgvector column value to a float32 ndarray.
+
+    The asyncpg codec decodes halfvec columns to HalfVector wrapper objects,
+    which numpy cannot coerce directly; vector columns happen to decode to
+    ndarrays today but are unwrapped the same way in case that changes.
+    """
+    if isinstance(value, (HalfVector, Vector)):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale a vector (or matrix of row vectors) to unit L2 norm.
+
+    Stored and query embeddings are normalized so cosine similarity reduces
+    to a plain dot product; pgvector's <#> operator can then skip the norm
+    computation on every comparison.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    return vectors / norms
+
+
+def quantize_i8(vec: np.ndarray) -> Tuple[bytes, float]:
+    """
+    Symmetric int8 quantization by max-abs scale.
+
+    Returns the int8 payload and the scale needed to reconstruct magnitudes.
+    Cosine ranking itself is scale-invariant, so the first-stage scan can
+    compare int8 rows directly.
+    """
+    scale = float(np.max(np.abs(vec))) if vec.size else 0.0
+    if scale == 0.0:
+        scale = 1.0
+    q = np.round(vec / scale * 127.0).astype(np.int8)
+    return q.tobytes(), scale
+
+
+def cosine_distances(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """
+    Cosine distance of the query against every matrix row.
+
+    Matches pgvector's <=> convention (0 identical, 2 opposite) so callers
+    can reuse the same distance-to-score conversion as the SQL path.
+    """
+    if simsimd is not None:
+        return np.asarray(
+            simsimd.cdist(query[None, :], matrix, metric="cosine"), dtype=np.float32
+        )[0]
+    sims = matrix @ query
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    return 1.0 - sims / np.where(norms == 0, 1.0, norms)
+
+
+class _CachedStore:
+    __slots__ = ("rows", "matrix", "i8_matrix", "loaded_at")
+
+    def __init__(
+        self,
+        rows: Optional[List[Dict[str, Any]]],
+        matrix: Optional[np.ndarray],
+        i8_matrix: Optional[np.ndarray] = None
+    ):
+        # rows is None for stores marked too large to cache
+        self.rows = rows
+        self.matrix = matrix
+        self.i8_matrix = i8_matrix
+        self.loaded_at = time.monotonic()
+
+
+class StoreMatrixCache:
+    """TTL cache of per-store embedding matrices for in-process scoring"""
+
+    def __init__(self, max_rows: int, ttl: float):
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._stores: Dict[str, _CachedStore] = {}
+        self._lock = asyncio.Lock()
+
+    async def search(
+        self, store_id: str, query: np.ndarray, limit: int
+    ) -> Optional[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """
+        Return (rows, distances) for the top-limit hits, best first, or None
+        when the store is too large to cache and the caller should fall back
+        to the SQL path.
+
+        Raises LookupError if the vector store does not exist.
+        """
+        entry = await self._get(store_id)
+        if entry.rows is None:
+            return None
+        if not entry.rows:
+            return [], np.empty(0, dtype=np.float32)
+
+        k = min(limit, len(entry.rows))
+
+        if entry.i8_matrix is not None and simsimd is not None and len(entry.rows) > 4 * k:
+            # First stage: int8 scan shortlists 4x the requested k at a
+            # quarter of the memory traffic; fp32 reranks the shortlist.
+            # Cosine is scale-invariant, so per-row scales can be ignored.
+            q8 = np.round(query / (np.max(np.abs(query)) or 1.0) * 127.0).astype(np.int8)
+            prelim = np.asarray(
+                simsimd.cdist(q8[None, :], entry.i8_matrix, metric="cosine"),
+                dtype=np.float32
+            )[0]
+            shortlist = np.argpartition(prelim, 4 * k - 1)[:4 * k]
+            distances = cosine_distances(query, entry.matrix[shortlist])
+            order = np.argsort(distances)[:k]
+            top = shortlist[order]
+            distances = distances[order]
+        else:
+            full = cosine_distances(query, entry.matrix)
+            # argpartition finds the top-k in O(n); only those get fully sorted
+            top = np.argpartition(full, k - 1)[:k]
+            top = top[np.argsort(full[top])]
+            distances = full[top]
+
+        return [entry.rows[i] for i in top], distances
+
+    async def _get(self, store_id: str) -> _CachedStore:
+        async with self._lock:
+            entry = self._stores.get(store_id)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+                return entry
+
+        entry = await self._load(store_id)
+
+        async with self._lock:
+            self._stores[store_id] = entry
+        return entry
+
+    async def _load(self, store_id: str) -> _CachedStore:
+        exists = await database.fetch(
+            f"SELECT 1 FROM {_VECTOR_STORES_TABLE} WHERE id = $1", store_id
+        )
+        if not exists:
+            raise LookupError("Vector store not found")
+
+        f = DB_FIELDS
+        i8_col = f"{f.embedding_field}_i8"
+        records = await database.fetch(
+            f"""
+            SELECT {f.id_field}, {f.content_field}, {f.metadata_field},
+                   {f.embedding_field}, {i8_col}
+            FROM {_EMBEDDINGS_TABLE}
+            WHERE {f.vector_store_id_field} = $1
+            LIMIT {self.max_rows + 1}
+            """,
+            store_id
+        )
+        if len(records) > self.max_rows:
+            # Too large for in-process scoring; remember that for one TTL
+            return _CachedStore(None, None)
+        if not records:
+            return _CachedStore([], None)
+
+        rows = [dict(r) for r in records]
+        matrix = np.asarray(
+            [_as_float32(r[f.embedding_field]) for r in records],
+            dtype=np.float32
+        )
+
+        # The int8 first-stage matrix is only usable when every row carries
+        # a quantized payload (rows inserted before the column existed skip it)
+        i8_matrix = None
+        if all(r[i8_col] is not None for r in records):
+            i8_matrix = np.frombuffer(
+                b"".join(r[i8_col] for r in records), dtype=np.int8
+            ).reshape(len(records), -1)
+
+        return _CachedStore(rows, matrix, i8_matrix)
+
+
+# Global cache instance, sized from settings
+store_cache = StoreMatrixCache(
+    max_rows=settings.local_search.max_rows,
+    ttl=settings.local_search.ttl_seconds
+)
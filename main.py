@@ -1,13 +1,26 @@
 import os
 import asyncio
+import hmac
+import logging
 import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
 from typing import List, Optional
+from uuid import uuid4
+
+import numpy as np
+import orjson
+from asyncpg.exceptions import ForeignKeyViolationError
 from fastapi import FastAPI, HTTPException, Depends, Header
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from prisma import Prisma
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 
+import database
+import local_search
+import semantic_cache
+
 from models import (
     VectorStoreCreateRequest,
     VectorStoreResponse,
@@ -21,15 +34,57 @@ from models import (
     VectorStoreListResponse,
     ContentChunk
 )
-from config import settings
+from config import settings, DB_FIELDS
 from embedding_service import embedding_service
 
 load_dotenv()
 
+
+class NumpyORJSONResponse(ORJSONResponse):
+    """
+    ORJSONResponse with numpy-aware options: ndarrays in response payloads
+    are serialized natively in Rust (no .tolist() materialization) and
+    non-string dict keys in metadata do not raise.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+
+
+async def warmup():
+    """Prime the connection pool and the embedding backend"""
+    # One round-trip opens a pooled connection and registers its codecs
+    await database.fetch("SELECT 1")
+    # Loading/encoding once here moves the local model's cold start out of
+    # the first request
+    if settings.embedding.backend == "local":
+        try:
+            await embedding_service.backend.embed(["warmup"])
+        except Exception:
+            logging.warning("Embedding backend warmup failed", exc_info=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect to the database and warm hot paths before serving traffic"""
+    await database.connect()
+    await database.ensure_schema()
+    await warmup()
+    yield
+    await database.disconnect()
+
+
 app = FastAPI(
     title="OpenAI Vector Stores API",
     description="OpenAI-compatible Vector Stores API using PGVector",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson encodes responses with SIMD-accelerated numeric formatting and
+    # UTF-8 validation; large search/list pages are encoded on the hot path
+    default_response_class=NumpyORJSONResponse
 )
 
 # CORS middleware
@@ -41,37 +96,226 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global Prisma client
-db = Prisma()
+# Table names are fixed at startup; resolve them once here instead of
+# re-reading settings on every request. DB_FIELDS comes frozen from config.
+VECTOR_STORES_TABLE = settings.table_names["vector_stores"]
+EMBEDDINGS_TABLE = settings.table_names["embeddings"]
+
+# pgvector column type for the embedding column. halfvec (fp16) halves the
+# bytes per row versus fp32, which halves page I/O and index memory for the
+# distance scan; set EMBEDDING__VECTOR_TYPE=vector to keep fp32 storage.
+VECTOR_TYPE = settings.embedding.vector_type
+
+# Pre-encoded once so the per-request check is a single constant-time
+# byte comparison with no credential-model instantiation
+_EXPECTED_API_KEY = settings.server_api_key.encode()
+
+# Statement texts whose shape does not vary per request, assembled once at
+# import time. Handlers reference the constants, so the hot path does no
+# f-string interpolation or settings lookups, and every request presents
+# the same statement text to asyncpg's prepared-statement cache.
+
+INSERT_VECTOR_STORE_SQL = f"""
+    INSERT INTO {VECTOR_STORES_TABLE} (id, name, file_counts, status, usage_bytes, expires_after, metadata, created_at)
+    VALUES (gen_random_uuid(), $1, $2, $3, $4, $5, $6, NOW())
+    RETURNING id, name, file_counts, status, usage_bytes, expires_after, metadata,
+             EXTRACT(EPOCH FROM created_at)::bigint as created_at_timestamp,
+             EXTRACT(EPOCH FROM expires_at)::bigint as expires_at_ts,
+             EXTRACT(EPOCH FROM last_active_at)::bigint as last_active_at_ts
+    """
+
+INSERT_EMBEDDING_SQL = f"""
+    WITH ins AS (
+        INSERT INTO {EMBEDDINGS_TABLE} ({DB_FIELDS.id_field}, {DB_FIELDS.vector_store_id_field}, {DB_FIELDS.content_field},
+                                 {DB_FIELDS.embedding_field}, {DB_FIELDS.embedding_field}_i8, {DB_FIELDS.embedding_field}_scale,
+                                 {DB_FIELDS.metadata_field}, {DB_FIELDS.created_at_field})
+        VALUES (gen_random_uuid(), $1, $2, $3::{VECTOR_TYPE}, $4, $5, $6, NOW())
+        RETURNING {DB_FIELDS.id_field}, {DB_FIELDS.vector_store_id_field}, {DB_FIELDS.content_field},
+                 {DB_FIELDS.metadata_field}, EXTRACT(EPOCH FROM {DB_FIELDS.created_at_field})::bigint as created_at_timestamp
+    ),
+    upd AS (
+        UPDATE {VECTOR_STORES_TABLE}
+        SET file_counts = file_counts || jsonb_build_object(
+                    'completed', (file_counts->>'completed')::int + 1,
+                    'total', (file_counts->>'total')::int + 1
+                ),
+            usage_bytes = usage_bytes + $7,
+            last_active_at = NOW()
+        WHERE id = $1
+    )
+    SELECT * FROM ins
+    """
+
+# The stats columns are NOT NULL with defaults (ensure_defaults), so no
+# COALESCE wrappers are needed on the increments.
+UPDATE_STORE_STATS_BATCH_SQL = f"""
+    UPDATE {VECTOR_STORES_TABLE}
+    SET file_counts = file_counts || jsonb_build_object(
+                'completed', (file_counts->>'completed')::int + $2,
+                'total', (file_counts->>'total')::int + $2
+            ),
+        usage_bytes = usage_bytes + $3,
+        last_active_at = NOW()
+    WHERE id = $1
+    """
 
-security = HTTPBearer()
+COPY_EMBEDDING_COLUMNS = [
+    DB_FIELDS.id_field,
+    DB_FIELDS.vector_store_id_field,
+    DB_FIELDS.content_field,
+    DB_FIELDS.embedding_field,
+    f"{DB_FIELDS.embedding_field}_i8",
+    f"{DB_FIELDS.embedding_field}_scale",
+    DB_FIELDS.metadata_field,
+    DB_FIELDS.created_at_field
+]
 
 
-async def get_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Validate API key from Authorization header"""
-    expected_key = settings.server_api_key
-    if credentials.credentials != expected_key:
+async def get_api_key(authorization: Optional[str] = Header(None)):
+    """Validate API key from Authorization header (constant-time compare)"""
+    if authorization is None:
         raise HTTPException(status_code=401, detail="Invalid API key")
-    return credentials.credentials
+    token = authorization.removeprefix("Bearer ")
+    if not hmac.compare_digest(token.encode(), _EXPECTED_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    return token
+
+
+def _compile_result_builder():
+    """
+    Specialize the row -> SearchResult projection for the configured field
+    names. The names are known at startup, so they are bound once as closure
+    locals; the per-row work is then three dict lookups with no attribute
+    chasing through DB_FIELDS. (A closure gives the same specialization as
+    eval-based codegen without the readability cost.)
+    """
+    id_field = DB_FIELDS.id_field
+    content_field = DB_FIELDS.content_field
+    metadata_field = DB_FIELDS.metadata_field
+
+    def build_result(row, score: float, include_metadata: bool) -> SearchResult:
+        metadata = row[metadata_field] or {}
+        return SearchResult.model_construct(
+            file_id=row[id_field],
+            filename=metadata.get('filename', 'document.txt'),
+            score=score,
+            attributes=metadata if include_metadata else None,
+            content=[ContentChunk.model_construct(type="text", text=row[content_field])]
+        )
+
+    return build_result
+
+
+build_search_result = _compile_result_builder()
+
+
+def scores_from_distances(distances: np.ndarray) -> list:
+    """
+    Map cosine distances (0 identical .. 2 opposite) to similarity scores
+    in one vectorized sweep; a single bulk tolist() materializes the Python
+    floats for the response models instead of per-row arithmetic.
+    """
+    return np.clip(1.0 - distances * 0.5, 0.0, None).tolist()
+
+
+async def generate_query_embedding(query: str) -> np.ndarray:
+    """
+    Generate an embedding for the query via the configured backend;
+    concurrent queries against a remote backend are coalesced into one
+    batched call by the service's micro-batcher
+    """
+    return await embedding_service.generate_query_embedding(query)
 
 
-@app.on_event("startup")
-async def startup():
-    """Connect to database on startup"""
-    await db.connect()
+@lru_cache(maxsize=4)
+def build_search_sql(has_filters: bool) -> str:
+    """
+    Build the fused similarity-search SQL, with or without a metadata filter.
 
+    A single statement both verifies the vector store exists and runs the
+    similarity scan, so a search costs one DB round-trip instead of two.
+    Vectors are stored unit-normalized, so the <#> negative-inner-product
+    operator ranks identically to cosine while skipping the per-comparison
+    norm computation; its value is cosine distance minus one.
+    A marker row (is_marker = TRUE) carries the existence flag; the actual
+    hits follow with is_marker = FALSE.
 
-@app.on_event("shutdown")
-async def shutdown():
-    """Disconnect from database on shutdown"""
-    await db.disconnect()
+    Filters are one jsonb containment predicate (metadata @> $3) rather
+    than per-key ->> extractions: Postgres evaluates a single expression
+    per row regardless of filter count, the GIN jsonb_path_ops index can
+    serve it, and only two statement shapes exist - so every request hits
+    asyncpg's prepared-statement cache. LIMIT is a bind parameter for the
+    same reason.
+    """
+    f = DB_FIELDS
+    if has_filters:
+        conditions = f" AND {f.metadata_field} @> $3::jsonb"
+        param_count = 4
+    else:
+        conditions = ""
+        param_count = 3
+    return f"""
+        WITH vs AS (
+            SELECT 1 FROM {VECTOR_STORES_TABLE} WHERE id = $2
+        ),
+        hits AS (
+            SELECT
+                {f.id_field},
+                {f.content_field},
+                {f.metadata_field},
+                ({f.embedding_field} <#> $1::{VECTOR_TYPE}) as distance
+            FROM {EMBEDDINGS_TABLE}
+            WHERE {f.vector_store_id_field} = $2
+              AND EXISTS (SELECT 1 FROM vs){conditions}
+            ORDER BY distance ASC
+            LIMIT ${param_count}
+        )
+        SELECT NULL::text AS {f.id_field}, NULL::text AS {f.content_field},
+               NULL::jsonb AS {f.metadata_field}, NULL::float8 AS distance,
+               EXISTS (SELECT 1 FROM vs) AS store_exists, TRUE AS is_marker
+        UNION ALL
+        SELECT {f.id_field}, {f.content_field}, {f.metadata_field}, distance,
+               TRUE, FALSE
+        FROM hits
+        """
 
 
-async def generate_query_embedding(query: str) -> List[float]:
+@lru_cache(maxsize=4)
+def build_list_sql(has_after: bool, has_before: bool) -> str:
     """
-    Generate an embedding for the query using LiteLLM
+    Build the store-listing SQL for a cursor shape (after/before present).
+
+    Keyset pagination on (created_at, id): each cursor id anchors the scan
+    via a primary-key lookup of its sort key, and the row comparison walks
+    the composite index from that point - no offset-style scan-and-filter,
+    so page latency is independent of store count. The id tiebreaker makes
+    the ordering total, so cursors are exact. Only four shapes exist, so
+    every request reuses a cached statement text.
     """
-    return await embedding_service.generate_embedding(query)
+    query = f"""
+        SELECT id, name, file_counts, status, usage_bytes, expires_after, metadata,
+               EXTRACT(EPOCH FROM created_at)::bigint as created_at_timestamp,
+               EXTRACT(EPOCH FROM expires_at)::bigint as expires_at_ts,
+               EXTRACT(EPOCH FROM last_active_at)::bigint as last_active_at_ts
+        FROM {VECTOR_STORES_TABLE}
+        """
+    conditions = []
+    param_count = 1
+    if has_after:
+        conditions.append(
+            f"(created_at, id) < "
+            f"(SELECT created_at, id FROM {VECTOR_STORES_TABLE} WHERE id = ${param_count})"
+        )
+        param_count += 1
+    if has_before:
+        conditions.append(
+            f"(created_at, id) > "
+            f"(SELECT created_at, id FROM {VECTOR_STORES_TABLE} WHERE id = ${param_count})"
+        )
+        param_count += 1
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + f" ORDER BY created_at DESC, id DESC LIMIT ${param_count}"
 
 
 @app.post("/v1/vector_stores", response_model=VectorStoreResponse)
@@ -83,16 +327,8 @@ async def create_vector_store(
     Create a new vector store.
     """
     try:
-        # Use raw SQL to insert the vector store with configurable table/field names
-        vector_store_table = settings.table_names["vector_stores"]
-        
-        result = await db.query_raw(
-            f"""
-            INSERT INTO {vector_store_table} (id, name, file_counts, status, usage_bytes, expires_after, metadata, created_at)
-            VALUES (gen_random_uuid(), $1, $2, $3, $4, $5, $6, NOW())
-            RETURNING id, name, file_counts, status, usage_bytes, expires_after, expires_at, last_active_at, metadata, 
-                     EXTRACT(EPOCH FROM created_at)::bigint as created_at_timestamp
-            """,
+        result = await database.fetch(
+            INSERT_VECTOR_STORE_SQL,
             request.name,
             {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0},
             "completed",
@@ -106,17 +342,18 @@ async def create_vector_store(
             
         vector_store = result[0]
         
-        # Convert to response format
+        # Convert to response format; epochs are extracted SQL-side so no
+        # datetime objects are built just to be discarded
         created_at = int(vector_store["created_at_timestamp"])
-        expires_at = int(vector_store["expires_at"].timestamp()) if vector_store.get("expires_at") else None
-        last_active_at = int(vector_store["last_active_at"].timestamp()) if vector_store.get("last_active_at") else None
-        
-        return VectorStoreResponse(
+        expires_at = vector_store["expires_at_ts"]
+        last_active_at = vector_store["last_active_at_ts"]
+
+        return VectorStoreResponse.model_construct(
             id=vector_store["id"],
             created_at=created_at,
             name=vector_store["name"],
-            usage_bytes=vector_store["usage_bytes"] or 0,
-            file_counts=vector_store["file_counts"] or {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0},
+            usage_bytes=vector_store["usage_bytes"],
+            file_counts=vector_store["file_counts"],
             status=vector_store["status"],
             expires_after=vector_store["expires_after"],
             expires_at=expires_at,
@@ -140,39 +377,14 @@ async def list_vector_stores(
     """
     try:
         limit = min(limit or 20, 100)  # Cap at 100 results
-        
-        vector_store_table = settings.table_names["vector_stores"]
-        
-        # Build base query
-        base_query = f"""
-        SELECT id, name, file_counts, status, usage_bytes, expires_after, expires_at, last_active_at, metadata,
-               EXTRACT(EPOCH FROM created_at)::bigint as created_at_timestamp
-        FROM {vector_store_table}
-        """
-        
-        # Add pagination conditions
-        conditions = []
-        params = []
-        param_count = 1
-        
-        if after:
-            conditions.append(f"id > ${param_count}")
-            params.append(after)
-            param_count += 1
-            
-        if before:
-            conditions.append(f"id < ${param_count}")
-            params.append(before)
-            param_count += 1
-        
-        if conditions:
-            base_query += " WHERE " + " AND ".join(conditions)
-        
-        # Add ordering and limit
-        final_query = base_query + f" ORDER BY created_at DESC LIMIT {limit + 1}"
-        
-        # Execute query
-        results = await db.query_raw(final_query, *params)
+
+        # Fetch the cached statement for this cursor shape and bind the
+        # cursors plus limit; nothing is interpolated per request
+        final_query = build_list_sql(after is not None, before is not None)
+        params = [cursor for cursor in (after, before) if cursor is not None]
+        params.append(limit + 1)
+
+        results = await database.fetch(final_query, *params)
         
         # Check if there are more results
         has_more = len(results) > limit
@@ -183,15 +395,15 @@ async def list_vector_stores(
         vector_stores = []
         for row in results:
             created_at = int(row["created_at_timestamp"])
-            expires_at = int(row["expires_at"].timestamp()) if row.get("expires_at") else None
-            last_active_at = int(row["last_active_at"].timestamp()) if row.get("last_active_at") else None
-            
-            vector_store = VectorStoreResponse(
+            expires_at = row["expires_at_ts"]
+            last_active_at = row["last_active_at_ts"]
+
+            vector_store = VectorStoreResponse.model_construct(
                 id=row["id"],
                 created_at=created_at,
                 name=row["name"],
-                usage_bytes=row["usage_bytes"] or 0,
-                file_counts=row["file_counts"] or {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0},
+                usage_bytes=row["usage_bytes"],
+                file_counts=row["file_counts"],
                 status=row["status"],
                 expires_after=row["expires_after"],
                 expires_at=expires_at,
@@ -204,7 +416,7 @@ async def list_vector_stores(
         first_id = vector_stores[0].id if vector_stores else None
         last_id = vector_stores[-1].id if vector_stores else None
         
-        return VectorStoreListResponse(
+        return VectorStoreListResponse.model_construct(
             data=vector_stores,
             first_id=first_id,
             last_id=last_id,
@@ -217,94 +429,172 @@ async def list_vector_stores(
         raise HTTPException(status_code=500, detail=f"Failed to list vector stores: {str(e)}")
 
 
+async def stream_search_results(query: str, params: list, ef_search: int, include_metadata: bool):
+    """
+    Stream search hits as NDJSON, one SearchResult per line.
+
+    Rows are serialized and yielded as the server-side cursor produces them,
+    overlapping DB fetch with network transmit; peak memory stays independent
+    of page size. A missing store is reported as an error line since headers
+    are already sent.
+    """
+    async with database.get_pool().acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL hnsw.ef_search = {ef_search}")
+            async for row in conn.cursor(query, *params):
+                if row["is_marker"]:
+                    if not row["store_exists"]:
+                        yield orjson.dumps({"error": "Vector store not found"}) + b"\n"
+                        return
+                    continue
+                # <#> on unit vectors is cosine distance minus one
+                score = max(0.0, 0.5 * (1.0 - row["distance"]))
+                result = build_search_result(row, score, include_metadata)
+                yield orjson.dumps(result.model_dump()) + b"\n"
+
+
 @app.post("/v1/vector_stores/{vector_store_id}/search", response_model=VectorStoreSearchResponse)
 @app.post("/vector_stores/{vector_store_id}/search", response_model=VectorStoreSearchResponse)
 async def search_vector_store(
     vector_store_id: str,
     request: VectorStoreSearchRequest,
+    stream: bool = False,
     api_key: str = Depends(get_api_key)
 ):
     """
     Search a vector store for similar content.
+
+    With ?stream=true, results are returned incrementally as NDJSON instead
+    of one materialized response page.
     """
     try:
-        # Check if vector store exists
-        vector_store_table = settings.table_names["vector_stores"]
-        vector_store_result = await db.query_raw(
-            f"SELECT id FROM {vector_store_table} WHERE id = $1",
-            vector_store_id
-        )
-        if not vector_store_result:
-            raise HTTPException(status_code=404, detail="Vector store not found")
-        
-        # Generate embedding for query
+        # Generate the query embedding; the store-existence check is fused
+        # into the search statement itself, so there is no separate
+        # preflight round-trip to overlap with
         query_embedding = await generate_query_embedding(request.query)
-        query_vector_str = "[" + ",".join(map(str, query_embedding)) + "]"
+
+        # Normalized to unit length to match the stored vectors (so <#> is
+        # exact cosine ranking) and passed to asyncpg as a float32 array so
+        # the pgvector binary codec ships 4 bytes/dim with no text parsing
+        query_vector = local_search.l2_normalize(
+            np.asarray(query_embedding, dtype=np.float32)
+        )
         
-        # Build the raw SQL query for vector similarity search
         limit = min(request.limit or 20, 100)  # Cap at 100 results
-        
-        # Base query with vector similarity using cosine distance
-        # Use configurable field names
-        fields = settings.db_fields
-        table_name = settings.table_names["embeddings"]
-        
-        # Build query with proper parameter placeholders for Prisma
-        param_count = 1
-        query_params = [query_vector_str, vector_store_id]
-        
-        base_query = f"""
-        SELECT 
-            {fields.id_field},
-            {fields.content_field},
-            {fields.metadata_field},
-            ({fields.embedding_field} <=> ${param_count}::vector) as distance
-        FROM {table_name} 
-        WHERE {fields.vector_store_id_field} = ${param_count + 1}
-        """
-        param_count += 2
-        
-        # Add metadata filters if provided
-        filter_conditions = []
-        
+
+        # Semantic cache: a recent query whose embedding is close enough is
+        # treated as a paraphrase and its raw hits reused, skipping the
+        # similarity scan; the page is re-projected here so the current
+        # request's return_metadata and limit are honored. Filtered
+        # searches are excluded since the cache key ignores filters.
+        use_semantic_cache = (
+            bool(request.use_semantic_cache) and not stream and not request.filters
+        )
+        if use_semantic_cache:
+            cached = await semantic_cache.result_cache.get(
+                vector_store_id, query_vector, limit
+            )
+            if cached is not None:
+                cached_rows, cached_distances = cached
+                return VectorStoreSearchResponse.model_construct(
+                    search_query=request.query,
+                    data=[
+                        build_search_result(row, score, request.return_metadata)
+                        for row, score in zip(
+                            cached_rows[:limit],
+                            scores_from_distances(cached_distances[:limit])
+                        )
+                    ],
+                    has_more=False,
+                    next_page=None
+                )
+
+        # In-process fast path: small stores are scored with SIMD kernels
+        # against a cached candidate matrix, skipping the SQL scan while the
+        # cache is fresh
+        if (
+            settings.local_search.enabled
+            and not stream
+            and not request.filters
+            and limit <= settings.local_search.max_limit
+        ):
+            try:
+                local_hits = await local_search.store_cache.search(
+                    vector_store_id, query_vector, limit
+                )
+            except LookupError:
+                raise HTTPException(status_code=404, detail="Vector store not found")
+            if local_hits is not None:
+                rows, distances = local_hits
+                return VectorStoreSearchResponse.model_construct(
+                    search_query=request.query,
+                    data=[
+                        build_search_result(row, score, request.return_metadata)
+                        for row, score in zip(rows, scores_from_distances(distances))
+                    ],
+                    has_more=False,
+                    next_page=None
+                )
+
+        # Fetch the cached SQL for this shape; the whole filter dict binds
+        # as one jsonb containment parameter (encoded by the orjson codec)
+        final_query = build_search_sql(bool(request.filters))
+
+        query_params = [query_vector, vector_store_id]
         if request.filters:
-            for key, value in request.filters.items():
-                filter_conditions.append(f"{fields.metadata_field}->>${param_count} = ${param_count + 1}")
-                query_params.extend([key, str(value)])
-                param_count += 2
-        
-        if filter_conditions:
-            base_query += " AND " + " AND ".join(filter_conditions)
-        
-        # Add ordering and limit
-        final_query = base_query + f" ORDER BY distance ASC LIMIT {limit}"
-        
-        # Execute the query
-        results = await db.query_raw(final_query, *query_params)
-        
-        # Convert results to SearchResult objects
-        search_results = []
-        for row in results:
-            # Convert distance to similarity score (1 - normalized_distance)
-            # Cosine distance ranges from 0 (identical) to 2 (opposite)
-            similarity_score = max(0, 1 - (row['distance'] / 2))
-            
-            # Extract filename from metadata or use a default
-            metadata = row[fields.metadata_field] or {}
-            filename = metadata.get('filename', 'document.txt')
-            
-            content_chunks = [ContentChunk(type="text", text=row[fields.content_field])]
-            
-            result = SearchResult(
-                file_id=row[fields.id_field],
-                filename=filename,
-                score=similarity_score,
-                attributes=metadata if request.return_metadata else None,
-                content=content_chunks
+            query_params.append(request.filters)
+        query_params.append(limit)
+
+        # Execute the query; the marker row carries the existence flag and
+        # the remaining rows are the actual hits. ef_search scales with the
+        # requested limit so HNSW recall holds on larger pages; SET LOCAL
+        # scopes the tuning to this transaction.
+        ef_search = max(limit * 2, 40)
+
+        if stream:
+            return StreamingResponse(
+                stream_search_results(final_query, query_params, ef_search, request.return_metadata),
+                media_type="application/x-ndjson"
             )
-            search_results.append(result)
-        
-        return VectorStoreSearchResponse(
+
+        raw_rows = await database.fetch_with_setup(
+            f"SET LOCAL hnsw.ef_search = {ef_search}",
+            final_query,
+            *query_params
+        )
+
+        store_exists = False
+        results = []
+        for row in raw_rows:
+            if row["is_marker"]:
+                store_exists = bool(row["store_exists"])
+            else:
+                results.append(row)
+
+        if not store_exists:
+            raise HTTPException(status_code=404, detail="Vector store not found")
+
+        # Convert distances to similarity scores in one vectorized sweep
+        # instead of per-row Python arithmetic. <#> on unit vectors returns
+        # cosine distance minus one, so shift back before scoring.
+        distances = np.fromiter(
+            (row["distance"] for row in results), dtype=np.float32, count=len(results)
+        )
+        distances += 1.0
+
+        # Project rows to SearchResult objects via the builder specialized
+        # at startup for the configured field names
+        search_results = [
+            build_search_result(row, score, request.return_metadata)
+            for row, score in zip(results, scores_from_distances(distances))
+        ]
+
+        if use_semantic_cache:
+            await semantic_cache.result_cache.put(
+                vector_store_id, query_vector, limit, results, distances
+            )
+
+        return VectorStoreSearchResponse.model_construct(
             search_query=request.query,
             data=search_results,
             has_more=False,  # TODO: Implement pagination
@@ -329,64 +619,39 @@ async def create_embedding(
     Add a single embedding to a vector store.
     """
     try:
-        # Check if vector store exists
-        vector_store_table = settings.table_names["vector_stores"]
-        vector_store_result = await db.query_raw(
-            f"SELECT id FROM {vector_store_table} WHERE id = $1",
-            vector_store_id
+        # Embeddings are stored unit-normalized so the <#> inner-product
+        # operator gives exact cosine ranking without per-comparison norms;
+        # they travel to Postgres via the pgvector binary codec and the
+        # int8 payload feeds the in-process first-stage scan
+        embedding_vector = local_search.l2_normalize(
+            np.asarray(request.embedding, dtype=np.float32)
         )
-        if not vector_store_result:
-            raise HTTPException(status_code=404, detail="Vector store not found")
-        
-        # Convert embedding to vector string format
-        embedding_vector_str = "[" + ",".join(map(str, request.embedding)) + "]"
-        
-        # Insert embedding using configurable field names
-        fields = settings.db_fields
-        table_name = settings.table_names["embeddings"]
-        
-        result = await db.query_raw(
-            f"""
-            INSERT INTO {table_name} ({fields.id_field}, {fields.vector_store_id_field}, {fields.content_field}, 
-                                     {fields.embedding_field}, {fields.metadata_field}, {fields.created_at_field})
-            VALUES (gen_random_uuid(), $1, $2, $3::vector, $4, NOW())
-            RETURNING {fields.id_field}, {fields.vector_store_id_field}, {fields.content_field}, 
-                     {fields.metadata_field}, EXTRACT(EPOCH FROM {fields.created_at_field})::bigint as created_at_timestamp
-            """,
+        embedding_i8, embedding_scale = local_search.quantize_i8(embedding_vector)
+
+        fields = DB_FIELDS
+
+        # Insert and stats update are fused into one CTE statement, so a
+        # create costs one DB round-trip; no preflight existence query
+        # either, since the FK constraint reports a missing store. The
+        # file_counts merge touches the JSONB value once, and content
+        # length is precomputed here rather than re-measured by Postgres.
+        result = await database.fetch(
+            INSERT_EMBEDDING_SQL,
             vector_store_id,
             request.content,
-            embedding_vector_str,
-            request.metadata or {}
+            embedding_vector,
+            embedding_i8,
+            embedding_scale,
+            request.metadata or {},
+            len(request.content)
         )
-        
+
         if not result:
             raise HTTPException(status_code=500, detail="Failed to create embedding")
-            
+
         embedding = result[0]
-        
-        # Update vector store statistics
-        await db.query_raw(
-            f"""
-            UPDATE {vector_store_table} 
-            SET file_counts = jsonb_set(
-                    COALESCE(file_counts, '{{"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0}}'::jsonb),
-                    '{{completed}}',
-                    (COALESCE(file_counts->>'completed', '0')::int + 1)::text::jsonb
-                ),
-                file_counts = jsonb_set(
-                    file_counts,
-                    '{{total}}',
-                    (COALESCE(file_counts->>'total', '0')::int + 1)::text::jsonb
-                ),
-                usage_bytes = COALESCE(usage_bytes, 0) + LENGTH($2),
-                last_active_at = NOW()
-            WHERE id = $1
-            """,
-            vector_store_id,
-            request.content
-        )
-        
-        return EmbeddingResponse(
+
+        return EmbeddingResponse.model_construct(
             id=embedding[fields.id_field],
             vector_store_id=embedding[fields.vector_store_id_field],
             content=embedding[fields.content_field],
@@ -396,12 +661,48 @@ async def create_embedding(
         
     except HTTPException:
         raise
+    except ForeignKeyViolationError:
+        raise HTTPException(status_code=404, detail="Vector store not found")
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to create embedding: {str(e)}")
 
 
+def build_embedding_records(
+    vector_store_id: str,
+    embeddings: List[EmbeddingCreateRequest],
+    row_ids: List[str],
+    created_at_dt: datetime
+) -> List[tuple]:
+    """
+    Assemble COPY records for a batch of embeddings.
+
+    Converts every embedding in one C-level pass - row views of the matrix
+    feed the binary pgvector codec without per-row conversion - and
+    quantizes each row for the int8 first-stage scan. Rows are stored
+    unit-normalized so <#> gives exact cosine ranking. Pure CPU work, so
+    large batches can run it in a worker thread.
+    """
+    embedding_matrix = local_search.l2_normalize(
+        np.asarray([e.embedding for e in embeddings], dtype=np.float32)
+    )
+    records = []
+    for i, embedding_req in enumerate(embeddings):
+        embedding_i8, embedding_scale = local_search.quantize_i8(embedding_matrix[i])
+        records.append((
+            row_ids[i],
+            vector_store_id,
+            embedding_req.content,
+            embedding_matrix[i],
+            embedding_i8,
+            embedding_scale,
+            embedding_req.metadata or {},
+            created_at_dt
+        ))
+    return records
+
+
 @app.post("/v1/vector_stores/{vector_store_id}/embeddings/batch", response_model=EmbeddingBatchCreateResponse)
 async def create_embeddings_batch(
     vector_store_id: str,
@@ -412,99 +713,73 @@ async def create_embeddings_batch(
     Add multiple embeddings to a vector store in batch.
     """
     try:
-        # Check if vector store exists
-        vector_store_table = settings.table_names["vector_stores"]
-        vector_store_result = await db.query_raw(
-            f"SELECT id FROM {vector_store_table} WHERE id = $1",
-            vector_store_id
-        )
-        if not vector_store_result:
-            raise HTTPException(status_code=404, detail="Vector store not found")
-        
+        # No preflight existence query: the FK constraint on the COPY
+        # reports a missing store, saving one DB round-trip per call
         if not request.embeddings:
             raise HTTPException(status_code=400, detail="No embeddings provided")
         
-        # Prepare batch insert
-        fields = settings.db_fields
-        table_name = settings.table_names["embeddings"]
-        
-        # Build VALUES clause for batch insert
-        values_clauses = []
-        params = []
-        param_count = 1
-        
-        for embedding_req in request.embeddings:
-            embedding_vector_str = "[" + ",".join(map(str, embedding_req.embedding)) + "]"
-            values_clauses.append(f"(gen_random_uuid(), ${param_count}, ${param_count + 1}, ${param_count + 2}::vector, ${param_count + 3}, NOW())")
-            params.extend([
-                vector_store_id,
-                embedding_req.content,
-                embedding_vector_str,
-                embedding_req.metadata or {}
-            ])
-            param_count += 4
-        
-        values_clause = ", ".join(values_clauses)
-        
-        # Execute batch insert
-        result = await db.query_raw(
-            f"""
-            INSERT INTO {table_name} ({fields.id_field}, {fields.vector_store_id_field}, {fields.content_field}, 
-                                     {fields.embedding_field}, {fields.metadata_field}, {fields.created_at_field})
-            VALUES {values_clause}
-            RETURNING {fields.id_field}, {fields.vector_store_id_field}, {fields.content_field}, 
-                     {fields.metadata_field}, EXTRACT(EPOCH FROM {fields.created_at_field})::bigint as created_at_timestamp
-            """,
-            *params
-        )
-        
-        if not result:
-            raise HTTPException(status_code=500, detail="Failed to create embeddings")
-        
+        # Ids and timestamps are generated here since COPY has no RETURNING.
+        # The created_at column is timestamp without time zone (Prisma
+        # DateTime), and binary COPY rejects aware datetimes for it, so the
+        # record carries naive UTC while the response epoch comes from the
+        # aware instant.
+        now_utc = datetime.now(timezone.utc)
+        created_at = int(now_utc.timestamp())
+        created_at_dt = now_utc.replace(tzinfo=None)
+        row_ids = [str(uuid4()) for _ in request.embeddings]
+
+        # Record assembly (matrix conversion + quantization) is CPU-bound;
+        # for large batches run it off the event loop so concurrent requests
+        # are not stalled for the duration
+        if len(request.embeddings) > 64:
+            records = await asyncio.to_thread(
+                build_embedding_records,
+                vector_store_id, request.embeddings, row_ids, created_at_dt
+            )
+        else:
+            records = build_embedding_records(
+                vector_store_id, request.embeddings, row_ids, created_at_dt
+            )
+
         # Calculate total content length for usage bytes update
         total_content_length = sum(len(emb.content) for emb in request.embeddings)
-        
-        # Update vector store statistics
-        await db.query_raw(
-            f"""
-            UPDATE {vector_store_table} 
-            SET file_counts = jsonb_set(
-                    COALESCE(file_counts, '{{"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0}}'::jsonb),
-                    '{{completed}}',
-                    (COALESCE(file_counts->>'completed', '0')::int + $2)::text::jsonb
-                ),
-                file_counts = jsonb_set(
-                    file_counts,
-                    '{{total}}',
-                    (COALESCE(file_counts->>'total', '0')::int + $2)::text::jsonb
-                ),
-                usage_bytes = COALESCE(usage_bytes, 0) + $3,
-                last_active_at = NOW()
-            WHERE id = $1
-            """,
+
+        # Stream the rows with binary COPY and update the store statistics
+        # in the same transaction: one round-trip for any N, no
+        # 65535-bind-parameter ceiling, and the stats can never drift from
+        # the inserted rows
+        await database.copy_and_execute(
+            EMBEDDINGS_TABLE,
+            records,
+            COPY_EMBEDDING_COLUMNS,
+            UPDATE_STORE_STATS_BATCH_SQL,
             vector_store_id,
             len(request.embeddings),
             total_content_length
         )
-        
-        # Convert results to response format
+
+
+        # Convert to response format from the data we just streamed; COPY
+        # has no RETURNING, so ids and timestamps come from the local batch
         embeddings = []
-        for row in result:
-            embeddings.append(EmbeddingResponse(
-                id=row[fields.id_field],
-                vector_store_id=row[fields.vector_store_id_field],
-                content=row[fields.content_field],
-                metadata=row[fields.metadata_field],
-                created_at=int(row["created_at_timestamp"])
+        for row_id, embedding_req in zip(row_ids, request.embeddings):
+            embeddings.append(EmbeddingResponse.model_construct(
+                id=row_id,
+                vector_store_id=vector_store_id,
+                content=embedding_req.content,
+                metadata=embedding_req.metadata,
+                created_at=created_at
             ))
-        
-        return EmbeddingBatchCreateResponse(
+
+        return EmbeddingBatchCreateResponse.model_construct(
             data=embeddings,
             created=int(time.time())
         )
         
     except HTTPException:
         raise
+    except ForeignKeyViolationError:
+        raise HTTPException(status_code=404, detail="Vector store not found")
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -519,4 +794,16 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host=settings.host, port=settings.port, reload=True) 
\ No newline at end of file
+    # uvloop (libuv) and httptools (C parser) replace the pure-Python
+    # asyncio loop and h11; one worker per core. reload spawns a watcher
+    # process pair and disables these fast paths, so it is opt-in for
+    # development via RELOAD=true.
+    uvicorn.run(
+        "main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=os.cpu_count(),
+        loop="uvloop",
+        http="httptools",
+        reload=settings.reload
+    )
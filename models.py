@@ -1,5 +1,7 @@
-from typing import Optional, Dict, Any, List
-from pydantic import BaseModel
+import base64
+from typing import Optional, Dict, Any, List, Union
+import numpy as np
+from pydantic import BaseModel, ConfigDict, field_validator
 from datetime import datetime
 
 
@@ -30,6 +32,7 @@ class VectorStoreSearchRequest(BaseModel):
     limit: Optional[int] = 20
     filters: Optional[Dict[str, Any]] = None
     return_metadata: Optional[bool] = True
+    use_semantic_cache: Optional[bool] = False
 
 
 class ContentChunk(BaseModel):
@@ -54,10 +57,27 @@ class VectorStoreSearchResponse(BaseModel):
 
 
 class EmbeddingCreateRequest(BaseModel):
+    # The embedding may be sent as a JSON float array or as base64-encoded
+    # raw little-endian fp32 bytes. Both forms reach the handlers as one
+    # float32 ndarray: base64 decodes with a single np.frombuffer, and JSON
+    # arrays convert in one np.asarray pass instead of validating ~1500
+    # boxed floats element by element.
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     content: str
-    embedding: List[float]
+    embedding: Union[List[float], np.ndarray]
     metadata: Optional[Dict[str, Any]] = None
 
+    @field_validator("embedding", mode="before")
+    @classmethod
+    def _decode_embedding(cls, value):
+        if isinstance(value, str):
+            return np.frombuffer(base64.b64decode(value), dtype=np.float32)
+        if isinstance(value, list):
+            # Raises on non-numeric entries, surfacing as a validation error
+            return np.asarray(value, dtype=np.float32)
+        return value
+
 
 class EmbeddingResponse(BaseModel):
     id: str
@@ -0,0 +1,100 @@
+"""
+Semantic (embedding-similarity) cache for search results.
+
+Many real queries are paraphrases of recent ones. Since every search already
+pays for a query embedding, a near-duplicate can be detected by comparing
+that embedding against the embeddings of recently answered queries: one
+vectorized cosine sweep over a small ring buffer costs microseconds. On a
+hit, the cached raw rows are re-projected for the current request without
+touching the database.
+
+Opt-in per request (use_semantic_cache) because it trades marginal recall
+for latency: a paraphrase within the similarity threshold gets the earlier
+query's results.
+"""
+
+import asyncio
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from local_search import cosine_distances
+
+
+class SemanticResultCache:
+    """
+    Fixed-size ring buffer of (store, query embedding, raw hits) entries.
+
+    Entries hold the raw result rows and their distances rather than a
+    rendered response page, so a hit is re-projected with the current
+    request's return_metadata instead of replaying whatever flag the
+    original request used. Each entry also remembers the limit it was
+    fetched with: a request asking for more rows than an entry holds is a
+    miss, never a silently truncated page.
+    """
+
+    def __init__(self, capacity: int = 1024, threshold: float = 0.97):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._store_ids: List[str] = []
+        self._limits: List[int] = []
+        self._rows: List[Any] = []
+        self._distances: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None  # allocated on first put
+        self._next = 0
+        self._lock = asyncio.Lock()
+
+    async def get(
+        self, store_id: str, query: np.ndarray, limit: int
+    ) -> Optional[Tuple[Any, np.ndarray]]:
+        """
+        Return (rows, distances) from the most similar recent query, or None.
+
+        Only entries for the same store that were cached with at least the
+        requested limit match; the caller slices down to its own limit.
+        """
+        async with self._lock:
+            n = len(self._rows)
+            if n == 0:
+                return None
+            # One SIMD sweep over the whole buffer; best match first
+            similarities = 1.0 - cosine_distances(query, self._matrix[:n])
+            for i in np.argsort(similarities)[::-1]:
+                if similarities[i] < self.threshold:
+                    return None
+                if self._store_ids[i] == store_id and self._limits[i] >= limit:
+                    return self._rows[i], self._distances[i]
+            return None
+
+    async def put(
+        self,
+        store_id: str,
+        query: np.ndarray,
+        limit: int,
+        rows: Any,
+        distances: np.ndarray
+    ):
+        async with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.capacity, query.shape[0]), dtype=np.float32)
+            i = self._next
+            if i < len(self._rows):
+                self._store_ids[i] = store_id
+                self._limits[i] = limit
+                self._rows[i] = rows
+                self._distances[i] = distances
+            else:
+                self._store_ids.append(store_id)
+                self._limits.append(limit)
+                self._rows.append(rows)
+                self._distances.append(distances)
+            self._matrix[i] = query
+            self._next = (self._next + 1) % self.capacity
+
+
+# Global cache instance, sized from settings
+result_cache = SemanticResultCache(
+    capacity=settings.semantic_cache.capacity,
+    threshold=settings.semantic_cache.threshold
+)